@@ -1,16 +1,80 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import (Flask, render_template, stream_template, request, redirect, url_for, flash,
+                   get_flashed_messages, session, g, has_request_context)
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+import click
+from sqlalchemy import event, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only, raiseload
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 from datetime import datetime
 import os
-from functools import wraps
+import base64
+import hashlib
+import hmac
+import secrets
+from functools import wraps, lru_cache
+import time
+import sqlite3
 
 app = Flask(__name__, static_folder='static')
-app.config['SECRET_KEY'] = os.urandom(24)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///banking.db'
+# A shared, stable key lets sessions survive worker restarts and work across workers
+app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY')
+# Deployed if the Docker image marked it (APP_ENV=production) or Vercel's runtime is detected
+IS_DEPLOYED = os.getenv('APP_ENV') == 'production' or bool(os.getenv('VERCEL'))
+if not app.config['SECRET_KEY']:
+    if IS_DEPLOYED:
+        raise RuntimeError('FLASK_SECRET_KEY must be set when deployed (APP_ENV=production or on Vercel)')
+    app.logger.warning('FLASK_SECRET_KEY is not set; using a per-process key, sessions will not persist')
+    app.config['SECRET_KEY'] = os.urandom(24)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///banking.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Development aids: log every statement, and flag GET pages that issue more than one
+app.config['SQLALCHEMY_ECHO'] = os.getenv('SQLALCHEMY_ECHO') == '1'
+app.config['SQL_STATEMENT_AUDIT'] = os.getenv('SQL_STATEMENT_AUDIT') == '1'
+# Keep SQLite connections open across requests so the page cache stays warm. Only a
+# file-backed SQLite database uses a QueuePool; in-memory SQLite and other backends keep
+# their engine defaults.
+database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+if database_uri.startswith('sqlite:///') and database_uri != 'sqlite:///:memory:':
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_pre_ping': True,
+        'pool_recycle': 3600,
+        'connect_args': {'check_same_thread': False},
+    }
 db = SQLAlchemy(app)
 
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # Runs once per physical connection, not per request
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA cache_size=-65536')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA mmap_size=268435456')
+    cursor.close()
+
+if app.config['SQL_STATEMENT_AUDIT']:
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def count_sql_statement(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            g.sql_statements = g.get('sql_statements', 0) + 1
+
+    @app.after_request
+    def audit_sql_statements(response):
+        # Read-only pages should load everything they render in a single query
+        statements = g.get('sql_statements', 0)
+        if request.method == 'GET' and statements > 1:
+            app.logger.warning('%s issued %d SQL statements', request.endpoint, statements)
+        return response
+
 # Models
 class Admin(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -28,21 +92,121 @@ class Customer(db.Model):
     account_type = db.Column(db.String(20), nullable=False)
     balance = db.Column(db.Float, default=0.0)
     date_opened = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(10), default='active')
+    status = db.Column(db.String(10), default='active', index=True)
+
+# Password hashing. PW_HASH_METHOD selects the scheme for new hashes ('argon2' or 'scrypt');
+# hashes from the other scheme and legacy werkzeug hashes are verified and upgraded on login.
+PW_HASH_METHOD = os.getenv('PW_HASH_METHOD', 'argon2')
+if PW_HASH_METHOD not in ('argon2', 'scrypt'):
+    raise RuntimeError(f"PW_HASH_METHOD must be 'argon2' or 'scrypt', not {PW_HASH_METHOD!r}")
+
+# Defaults follow the OWASP minimum for Argon2id: 19 MiB memory, 2 iterations, 1 lane
+password_hasher = PasswordHasher(
+    time_cost=int(os.getenv('ARGON2_T', '2')),
+    memory_cost=int(os.getenv('ARGON2_M', '19456')),
+    parallelism=int(os.getenv('ARGON2_P', '1')),
+)
+LEGACY_HASH_PREFIXES = ('pbkdf2:', 'scrypt:')
+
+# scrypt with N=2^14, r=8, p=1 (16 MiB), stored as scrypt$<log2 N>$<r>$<p>$<salt>$<key>
+SCRYPT_LOG_N, SCRYPT_R, SCRYPT_P = 14, 8, 1
+SCRYPT_PREFIX = 'scrypt$'
+
+def _scrypt(password, salt, log_n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=2 ** log_n, r=r, p=p, dklen=32)
+
+def _scrypt_hash(password):
+    salt = os.urandom(16)
+    key = _scrypt(password, salt, SCRYPT_LOG_N, SCRYPT_R, SCRYPT_P)
+    return '$'.join(['scrypt', str(SCRYPT_LOG_N), str(SCRYPT_R), str(SCRYPT_P),
+                     base64.b64encode(salt).decode(), base64.b64encode(key).decode()])
+
+def _scrypt_verify(stored_hash, password):
+    try:
+        _, log_n, r, p, salt, key = stored_hash.split('$')
+        expected = base64.b64decode(key)
+        candidate = _scrypt(password, base64.b64decode(salt), int(log_n), int(r), int(p))
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(candidate, expected)
+
+def hash_password(password):
+    if PW_HASH_METHOD == 'scrypt':
+        return _scrypt_hash(password)
+    return password_hasher.hash(password)
+
+# Every scheme below compares digests in constant time (hmac.compare_digest or libargon2)
+def verify_password(stored_hash, password):
+    if stored_hash.startswith(LEGACY_HASH_PREFIXES):
+        return check_password_hash(stored_hash, password)
+    if stored_hash.startswith(SCRYPT_PREFIX):
+        return _scrypt_verify(stored_hash, password)
+    try:
+        return password_hasher.verify(stored_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
 
-# Create tables
-with app.app_context():
+def password_needs_rehash(stored_hash):
+    if stored_hash.startswith(LEGACY_HASH_PREFIXES):
+        return True
+    if stored_hash.startswith(SCRYPT_PREFIX):
+        return (PW_HASH_METHOD != 'scrypt'
+                or stored_hash.split('$')[1:4] != [str(SCRYPT_LOG_N), str(SCRYPT_R), str(SCRYPT_P)])
+    return PW_HASH_METHOD == 'scrypt' or password_hasher.check_needs_rehash(stored_hash)
+
+def generate_account_number():
+    return f"ACC{secrets.token_hex(5).upper()}"
+
+# Verified against when no account matches, so every login attempt costs one hash check
+# (timing matches accounts hashed with the current scheme, not legacy werkzeug hashes).
+# Built on first use so importing the app does not pay for a full hash.
+@lru_cache(maxsize=1)
+def dummy_hash():
+    return hash_password('x')
+
+# Create tables (run once per deploy with `flask init-db`, not on every import)
+def init_db():
     db.create_all()
+    # create_all() skips existing tables, so add any indexes they are missing
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
     # Create default admin if none exists
     if not Admin.query.filter_by(username='admin').first():
         default_admin = Admin(
             username='admin',
             email='admin@example.com',
-            password=generate_password_hash('admin123')
+            password=hash_password('admin123')
         )
         db.session.add(default_admin)
         db.session.commit()
 
+@app.cli.command('init-db')
+def init_db_command():
+    """Create tables, indexes and the default admin."""
+    init_db()
+    click.echo('Database initialized')
+
+def bulk_add_customers(rows):
+    """Insert many customers in one transaction (one commit, one fsync).
+
+    Each row is a dict of Customer fields with a plain-text 'password';
+    a bank account number is generated for rows that do not supply one.
+    """
+    mappings = [
+        dict(row,
+             password=hash_password(row['password']),
+             bank_account_number=row.get('bank_account_number') or generate_account_number())
+        for row in rows
+    ]
+    try:
+        db.session.bulk_insert_mappings(Customer, mappings)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    invalidate_dashboard_counts()
+
 # Decorators for access control
 def login_required(f):
     @wraps(f)
@@ -53,15 +217,68 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def admin_required(f):
+def admin_only(f):
+    # login_required and the admin role check fused into a single wrapper
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_role' not in session or session['user_role'] != 'admin':
+        role = session.get('user_role')
+        if role is None:
+            flash('Please log in to access this page', 'danger')
+            return redirect(url_for('login'))
+        if role != 'admin':
             flash('You do not have permission to access this page', 'danger')
             return redirect(url_for('dashboard'))
         return f(*args, **kwargs)
     return decorated_function
 
+# Looks up both account kinds in one round-trip; admins sort first on a clash
+LOGIN_QUERY = text(
+    "SELECT id, username AS name, password, 'admin' AS role FROM admin WHERE username = :username "
+    "UNION ALL "
+    "SELECT id, full_name, password, 'customer' FROM customer WHERE email = :username AND status = 'active' "
+    "ORDER BY role"
+)
+
+DASHBOARD_COUNTS_QUERY = text(
+    "SELECT (SELECT COUNT(*) FROM admin), "
+    "(SELECT COUNT(*) FROM customer), "
+    "(SELECT COUNT(*) FROM customer WHERE status = 'active')"
+)
+
+def stream_list_template(template_name, **context):
+    # The session cookie is written before a streamed body is rendered, so consume
+    # flashed messages now; the template reads them back from the request cache.
+    get_flashed_messages(with_categories=True)
+    return stream_template(template_name, **context)
+
+# Dashboard counts are cached for a few seconds; writes bump the version to invalidate
+DASHBOARD_COUNTS_TTL = 5
+dashboard_counts_version = 0
+
+@lru_cache(maxsize=1)
+def _dashboard_counts(bucket, version):
+    return tuple(db.session.execute(DASHBOARD_COUNTS_QUERY).first())
+
+def dashboard_counts():
+    return _dashboard_counts(int(time.time()) // DASHBOARD_COUNTS_TTL, dashboard_counts_version)
+
+def invalidate_dashboard_counts():
+    global dashboard_counts_version
+    dashboard_counts_version += 1
+
+# Links without per-row arguments resolve to the same URL on every request
+cached_url_for = lru_cache(maxsize=256)(url_for)
+app.jinja_env.globals['cached_url_for'] = cached_url_for
+
+def get_current_customer():
+    # Loaded on first use and kept on g for the rest of the request; Session.get
+    # checks the identity map before querying
+    if 'current_customer' not in g:
+        g.current_customer = None
+        if 'user_id' in session and session.get('user_role') == 'customer':
+            g.current_customer = db.session.get(Customer, session['user_id'])
+    return g.current_customer
+
 # Routes
 @app.route('/')
 def index():
@@ -71,27 +288,29 @@ def index():
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
-        password = request.form.get('password')
-        
-        # Check if admin
-        admin = Admin.query.filter_by(username=username).first()
-        if admin and check_password_hash(admin.password, password):
-            session['user_id'] = admin.id
-            session['username'] = admin.username
-            session['user_role'] = 'admin'
-            flash('Welcome, Admin!', 'success')
-            return redirect(url_for('admin_dashboard'))
+        password = request.form.get('password', '')
         
-        # If not admin, check if it's a customer (using email as username)
-        customer = Customer.query.filter_by(email=username).first()
-        if customer and customer.status == 'active' and check_password_hash(customer.password, password):
-            session['user_id'] = customer.id
-            session['username'] = customer.full_name
-            session['user_role'] = 'customer'
-            flash('Welcome, Customer!', 'success')
+        # Admins log in with their username, customers with their email
+        user = db.session.execute(LOGIN_QUERY, {'username': username}).first()
+        # Exactly one verify on every path. The cost only matches for accounts already on the
+        # current scheme; legacy werkzeug hashes (e.g. scrypt:32768) verify several times slower
+        # than dummy_hash() until their owner logs in once and the hash is upgraded.
+        stored_hash = user.password if user is not None else dummy_hash()
+        if verify_password(stored_hash, password) and user is not None:
+            if password_needs_rehash(user.password):
+                model = Admin if user.role == 'admin' else Customer
+                db.session.get(model, user.id).password = hash_password(password)
+                db.session.commit()
+            # No flash on the login path: it would re-serialize the session cookie
+            session.permanent = False
+            session['user_id'] = user.id
+            session['username'] = user.name
+            session['user_role'] = user.role
+            if user.role == 'admin':
+                return redirect(url_for('admin_dashboard'))
             return redirect(url_for('customer_dashboard'))
         
-        flash('Invalid credentials or inactive account', 'danger')
+        return redirect(url_for('login', err=1))
     
     return render_template('login.html')
 
@@ -111,27 +330,27 @@ def dashboard():
 
 # Admin routes
 @app.route('/admin/dashboard')
-@login_required
-@admin_required
+@admin_only
 def admin_dashboard():
-    admin_count = Admin.query.count()
-    customer_count = Customer.query.count()
-    active_customers = Customer.query.filter_by(status='active').count()
+    admin_count, customer_count, active_customers = dashboard_counts()
     return render_template('admin/dashboard.html', 
                           admin_count=admin_count, 
                           customer_count=customer_count,
                           active_customers=active_customers)
 
 @app.route('/admin/admins')
-@login_required
-@admin_required
+@admin_only
 def admin_list():
-    admins = Admin.query.all()
-    return render_template('admin/admin_list.html', admins=admins)
+    admins = db.session.execute(
+        select(Admin).options(
+            load_only(Admin.id, Admin.username, Admin.email, Admin.created_at, raiseload=True),
+            raiseload('*')
+        ).execution_options(yield_per=500)
+    ).scalars()
+    return stream_list_template('admin/admin_list.html', admins=admins)
 
 @app.route('/admin/admins/add', methods=['GET', 'POST'])
-@login_required
-@admin_required
+@admin_only
 def admin_add():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -160,10 +379,11 @@ def admin_add():
         new_admin = Admin(
             username=username,
             email=email,
-            password=generate_password_hash(password)
+            password=hash_password(password)
         )
         db.session.add(new_admin)
         db.session.commit()
+        invalidate_dashboard_counts()
         
         flash('Admin created successfully', 'success')
         return redirect(url_for('admin_list'))
@@ -171,8 +391,7 @@ def admin_add():
     return render_template('admin/admin_form.html')
 
 @app.route('/admin/admins/edit/<int:id>', methods=['GET', 'POST'])
-@login_required
-@admin_required
+@admin_only
 def admin_edit(id):
     admin = Admin.query.get_or_404(id)
     
@@ -200,7 +419,7 @@ def admin_edit(id):
         admin.username = username
         admin.email = email
         if password:
-            admin.password = generate_password_hash(password)
+            admin.password = hash_password(password)
         
         db.session.commit()
         flash('Admin updated successfully', 'success')
@@ -209,8 +428,7 @@ def admin_edit(id):
     return render_template('admin/admin_form.html', admin=admin)
 
 @app.route('/admin/admins/delete/<int:id>', methods=['POST'])
-@login_required
-@admin_required
+@admin_only
 def admin_delete(id):
     admin = Admin.query.get_or_404(id)
     
@@ -221,20 +439,26 @@ def admin_delete(id):
     
     db.session.delete(admin)
     db.session.commit()
+    invalidate_dashboard_counts()
     flash('Admin deleted successfully', 'success')
     return redirect(url_for('admin_list'))
 
 # Customer routes (for admin)
 @app.route('/admin/customers')
-@login_required
-@admin_required
+@admin_only
 def customer_list():
-    customers = Customer.query.all()
-    return render_template('admin/customer_list.html', customers=customers)
+    customers = db.session.execute(
+        select(Customer).options(
+            load_only(Customer.id, Customer.full_name, Customer.email, Customer.bank_account_number,
+                      Customer.account_type, Customer.balance, Customer.date_opened, Customer.status,
+                      raiseload=True),
+            raiseload('*')
+        ).execution_options(yield_per=500)
+    ).scalars()
+    return stream_list_template('admin/customer_list.html', customers=customers)
 
 @app.route('/admin/customers/add', methods=['GET', 'POST'])
-@login_required
-@admin_required
+@admin_only
 def customer_add():
     if request.method == 'POST':
         full_name = request.form.get('full_name')
@@ -245,10 +469,6 @@ def customer_add():
         balance = float(request.form.get('balance', 0))
         status = request.form.get('status')
         
-        # Generate a unique account number (simplified for demo)
-        import random
-        bank_account_number = f"ACC{random.randint(10000, 99999)}"
-        
         # Validation
         if not full_name or not email or not account_type or not password:
             flash('Name, email, password and account type are required', 'danger')
@@ -266,14 +486,26 @@ def customer_add():
         new_customer = Customer(
             full_name=full_name,
             email=email,
-            password=generate_password_hash(password),
-            bank_account_number=bank_account_number,
+            password=hash_password(password),
+            bank_account_number=generate_account_number(),
             account_type=account_type,
             balance=balance,
             status=status or 'active'
         )
-        db.session.add(new_customer)
-        db.session.commit()
+        try:
+            db.session.add(new_customer)
+            db.session.commit()
+        except IntegrityError as error:
+            db.session.rollback()
+            if 'bank_account_number' not in str(error.orig):
+                # Email taken by a concurrent request after the check above
+                flash('Email already exists', 'danger')
+                return redirect(url_for('customer_add'))
+            # Account number collision; draw a new one and try once more
+            new_customer.bank_account_number = generate_account_number()
+            db.session.add(new_customer)
+            db.session.commit()
+        invalidate_dashboard_counts()
         
         flash('Customer created successfully', 'success')
         return redirect(url_for('customer_list'))
@@ -281,8 +513,7 @@ def customer_add():
     return render_template('admin/customer_form.html')
 
 @app.route('/admin/customers/edit/<int:id>', methods=['GET', 'POST'])
-@login_required
-@admin_required
+@admin_only
 def customer_edit(id):
     customer = Customer.query.get_or_404(id)
     
@@ -317,21 +548,22 @@ def customer_edit(id):
         customer.status = status
         
         if password:
-            customer.password = generate_password_hash(password)
+            customer.password = hash_password(password)
         
         db.session.commit()
+        invalidate_dashboard_counts()
         flash('Customer updated successfully', 'success')
         return redirect(url_for('customer_list'))
     
     return render_template('admin/customer_form.html', customer=customer)
 
 @app.route('/admin/customers/delete/<int:id>', methods=['POST'])
-@login_required
-@admin_required
+@admin_only
 def customer_delete(id):
     customer = Customer.query.get_or_404(id)
     db.session.delete(customer)
     db.session.commit()
+    invalidate_dashboard_counts()
     flash('Customer deleted successfully', 'success')
     return redirect(url_for('customer_list'))
 
@@ -343,12 +575,9 @@ def customer_dashboard():
         flash('Access denied', 'danger')
         return redirect(url_for('dashboard'))
     
-    customer = Customer.query.get(session['user_id'])
-    return render_template('customer/dashboard.html', customer=customer)
-
-# Handler for Vercel serverless deployment
-def handler(event, context):
-    return app
+    return render_template('customer/dashboard.html', customer=get_current_customer())
 
 if __name__ == '__main__':
+    with app.app_context():
+        init_db()
     app.run(debug=False)
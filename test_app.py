@@ -1,7 +1,269 @@
 # tests/test_smoke.py
-from app import app
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+# Point the app at a throwaway database before it is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+
+import app as app_module
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app import (app, db, init_db, hash_password, verify_password, password_needs_rehash,
+                 bulk_add_customers, dummy_hash, invalidate_dashboard_counts, Customer)
 #h212
 def test_index_returns_200():
     client = app.test_client()
     resp = client.get("/")
-    assert resp.status_code == 200
\ No newline at end of file
+    assert resp.status_code == 200
+
+@pytest.fixture
+def client():
+    with app.app_context():
+        db.drop_all()
+        init_db()
+    invalidate_dashboard_counts()
+    return app.test_client()
+
+def add_customer(email='jane@example.com', password='secret', status='active', password_hash=None):
+    with app.app_context():
+        customer = Customer(
+            full_name='Jane Doe',
+            email=email,
+            password=password_hash or hash_password(password),
+            bank_account_number='ACC' + email.split('@')[0].upper(),
+            account_type='savings',
+            status=status
+        )
+        db.session.add(customer)
+        db.session.commit()
+
+def login(client, username, password):
+    return client.post('/login', data={'username': username, 'password': password})
+
+def test_admin_login_by_username(client):
+    resp = login(client, 'admin', 'admin123')
+    assert resp.status_code == 302
+    assert resp.location.endswith('/admin/dashboard')
+    with client.session_transaction() as sess:
+        assert sess['user_role'] == 'admin'
+        assert sess['username'] == 'admin'
+
+def test_customer_login_by_email(client):
+    add_customer()
+    resp = login(client, 'jane@example.com', 'secret')
+    assert resp.status_code == 302
+    assert resp.location.endswith('/customer/dashboard')
+    with client.session_transaction() as sess:
+        assert sess['user_role'] == 'customer'
+        assert sess['username'] == 'Jane Doe'
+
+def test_inactive_customer_is_rejected(client):
+    add_customer(status='inactive')
+    resp = login(client, 'jane@example.com', 'secret')
+    assert resp.location.endswith('/login?err=1')
+    with client.session_transaction() as sess:
+        assert 'user_id' not in sess
+
+def test_wrong_password_redirects_with_error(client):
+    resp = login(client, 'admin', 'wrong')
+    assert resp.status_code == 302
+    assert resp.location.endswith('/login?err=1')
+    assert b'Invalid credentials' in client.get(resp.location).data
+
+@pytest.mark.parametrize('method', ['pbkdf2:sha256:1000', 'scrypt:1024:8:1'])
+def test_legacy_hash_is_upgraded_on_login(client, method):
+    add_customer(password_hash=generate_password_hash('secret', method=method))
+    resp = login(client, 'jane@example.com', 'secret')
+    assert resp.location.endswith('/customer/dashboard')
+    with app.app_context():
+        stored = Customer.query.filter_by(email='jane@example.com').one().password
+    assert stored.startswith('$argon2id$')
+    assert login(app.test_client(), 'jane@example.com', 'secret').location.endswith('/customer/dashboard')
+
+@pytest.mark.parametrize('username', ['admin', 'nobody'])
+def test_missing_password_field_is_rejected(client, username):
+    resp = client.post('/login', data={'username': username})
+    assert resp.status_code == 302
+    assert resp.location.endswith('/login?err=1')
+
+@pytest.fixture
+def scrypt_method(monkeypatch):
+    monkeypatch.setattr(app_module, 'PW_HASH_METHOD', 'scrypt')
+
+def test_scrypt_hash_round_trip(scrypt_method):
+    stored = hash_password('secret')
+    assert stored.startswith('scrypt$14$8$1$')
+    assert verify_password(stored, 'secret')
+    assert not verify_password(stored, 'wrong')
+    assert not password_needs_rehash(stored)
+
+@pytest.mark.parametrize('stored', [
+    'scrypt$',
+    'scrypt$14$8$1$c2FsdA==',
+    'scrypt$x$8$1$c2FsdA==$a2V5',
+    'scrypt$-1$8$1$c2FsdA==$a2V5',
+    'scrypt$40$8$1$c2FsdA==$a2V5',
+    'scrypt$14$8$1$not*base64$a2V5',
+    'scrypt$14$8$1$c2FsdA==$not*base64',
+    'not-a-hash',
+])
+def test_malformed_hash_does_not_verify(stored):
+    assert verify_password(stored, 'secret') is False
+
+def test_rehash_across_schemes(monkeypatch):
+    argon2_hash = hash_password('secret')
+    assert not password_needs_rehash(argon2_hash)
+    monkeypatch.setattr(app_module, 'PW_HASH_METHOD', 'scrypt')
+    scrypt_hash = hash_password('secret')
+    assert password_needs_rehash(argon2_hash)
+    assert not password_needs_rehash(scrypt_hash)
+    assert password_needs_rehash('scrypt$15$8$1$c2FsdA==$a2V5')
+    monkeypatch.setattr(app_module, 'PW_HASH_METHOD', 'argon2')
+    assert password_needs_rehash(scrypt_hash)
+    assert verify_password(scrypt_hash, 'secret')
+
+def test_bulk_add_customers_applies_defaults(client):
+    with app.app_context():
+        bulk_add_customers([
+            {'full_name': 'Ann', 'email': 'ann@example.com', 'password': 'a', 'account_type': 'savings'},
+            {'full_name': 'Bob', 'email': 'bob@example.com', 'password': 'b', 'account_type': 'checking',
+             'bank_account_number': 'ACC00001'},
+        ])
+        ann, bob = Customer.query.order_by(Customer.email).all()
+        assert (ann.status, ann.balance) == ('active', 0.0)
+        assert ann.date_opened is not None
+        assert ann.bank_account_number.startswith('ACC') and len(ann.bank_account_number) == 13
+        assert bob.bank_account_number == 'ACC00001'
+        assert verify_password(ann.password, 'a')
+
+def test_bulk_add_customers_rolls_back_on_failure(client):
+    add_customer(email='ann@example.com')
+    with app.app_context():
+        with pytest.raises(IntegrityError):
+            bulk_add_customers([
+                {'full_name': 'Bob', 'email': 'bob@example.com', 'password': 'b', 'account_type': 'savings'},
+                {'full_name': 'Ann', 'email': 'ann@example.com', 'password': 'a', 'account_type': 'savings'},
+            ])
+        # The session is usable again and no row from the failed batch was kept
+        assert [c.email for c in Customer.query.all()] == ['ann@example.com']
+
+def test_customer_dashboard_shows_signed_in_customer(client):
+    add_customer()
+    login(client, 'jane@example.com', 'secret')
+    resp = client.get('/customer/dashboard')
+    assert resp.status_code == 200
+    assert b'Jane Doe' in resp.data
+
+@pytest.mark.parametrize('database_url', ['sqlite://', 'sqlite:///:memory:'])
+def test_app_imports_with_in_memory_database(database_url):
+    env = dict(os.environ, DATABASE_URL=database_url)
+    result = subprocess.run([sys.executable, '-c', 'import app'], env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+def test_dummy_hash_is_built_on_first_unknown_login(client):
+    dummy_hash.cache_clear()
+    assert dummy_hash.cache_info().currsize == 0
+    login(client, 'admin', 'wrong')
+    assert dummy_hash.cache_info().currsize == 0
+    resp = login(client, 'nobody', 'secret')
+    assert resp.location.endswith('/login?err=1')
+    assert dummy_hash.cache_info().currsize == 1
+
+def new_customer_form(email='jane@example.com', **overrides):
+    form = {'full_name': 'Jane Doe', 'email': email, 'password': 'secret', 'confirm_password': 'secret',
+            'account_type': 'savings', 'balance': '10', 'status': 'active'}
+    form.update(overrides)
+    return form
+
+def test_list_pages_stream_rows_and_flash_once(client):
+    login(client, 'admin', 'admin123')
+    resp = client.post('/admin/customers/add', data=new_customer_form(), follow_redirects=True)
+    assert resp.status_code == 200
+    assert b'Jane Doe' in resp.data
+    assert b'$10.00' in resp.data
+    assert resp.data.count(b'Customer created successfully') == 1
+    assert b'</html>' in resp.data
+
+    resp = client.get('/admin/customers')
+    assert b'Jane Doe' in resp.data
+    assert b'Customer created successfully' not in resp.data
+
+    resp = client.get('/admin/admins')
+    assert resp.status_code == 200
+    assert b'admin@example.com' in resp.data
+    assert b'</html>' in resp.data
+
+def dashboard_counts(client):
+    resp = client.get('/admin/dashboard')
+    return tuple(int(n) for n in re.findall(rb'<h2 class="card-text">(\d+)</h2>', resp.data))
+
+def test_dashboard_counts_refresh_after_customer_writes(client):
+    login(client, 'admin', 'admin123')
+    assert dashboard_counts(client) == (1, 0, 0)
+
+    client.post('/admin/customers/add', data=new_customer_form())
+    assert dashboard_counts(client) == (1, 1, 1)
+
+    with app.app_context():
+        customer_id = Customer.query.filter_by(email='jane@example.com').one().id
+    client.post(f'/admin/customers/edit/{customer_id}', data=new_customer_form(status='inactive'))
+    assert dashboard_counts(client) == (1, 1, 0)
+
+    client.post(f'/admin/customers/delete/{customer_id}')
+    assert dashboard_counts(client) == (1, 0, 0)
+
+def test_customer_add_retries_on_account_number_collision(client, monkeypatch):
+    add_customer(email='ann@example.com')
+    numbers = iter(['ACCANN', 'ACCFRESH'])
+    monkeypatch.setattr(app_module, 'generate_account_number', lambda: next(numbers))
+    login(client, 'admin', 'admin123')
+    resp = client.post('/admin/customers/add', data=new_customer_form(), follow_redirects=True)
+    assert b'Customer created successfully' in resp.data
+    with app.app_context():
+        assert Customer.query.filter_by(email='jane@example.com').one().bank_account_number == 'ACCFRESH'
+
+def test_customer_add_reports_email_taken_after_check(client, monkeypatch):
+    def claim_email_then_generate():
+        # Another request inserts the same email between the check and the commit
+        with db.engine.begin() as conn:
+            conn.execute(insert(Customer).values(
+                full_name='Racer', email='jane@example.com', password='x',
+                bank_account_number='ACCRACER', account_type='savings'))
+        return 'ACCJANE'
+    monkeypatch.setattr(app_module, 'generate_account_number', claim_email_then_generate)
+    login(client, 'admin', 'admin123')
+    resp = client.post('/admin/customers/add', data=new_customer_form(), follow_redirects=True)
+    assert resp.status_code == 200
+    assert b'Email already exists' in resp.data
+    with app.app_context():
+        assert Customer.query.filter_by(email='jane@example.com').one().full_name == 'Racer'
+
+@pytest.mark.parametrize('deploy_env', [{'APP_ENV': 'production'}, {'VERCEL': '1'}])
+def test_deployed_app_requires_secret_key(deploy_env):
+    env = {k: v for k, v in os.environ.items() if k not in ('FLASK_SECRET_KEY', 'APP_ENV', 'VERCEL')}
+    env.update(deploy_env)
+    result = subprocess.run([sys.executable, '-c', 'import app'], env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    assert result.returncode != 0
+    assert 'FLASK_SECRET_KEY must be set' in result.stderr
+
+@pytest.mark.parametrize('signed_in, target, message', [
+    (False, '/login', b'Please log in to access this page'),
+    (True, '/dashboard', b'You do not have permission to access this page'),
+])
+def test_admin_only_redirects_non_admins(client, signed_in, target, message):
+    if signed_in:
+        add_customer()
+        login(client, 'jane@example.com', 'secret')
+    resp = client.get('/admin/customers')
+    assert resp.status_code == 302
+    assert resp.location.endswith(target)
+    assert message in client.get(resp.location, follow_redirects=True).data